@@ -4,10 +4,10 @@ import logging
 # 3rd party imports
 
 # local imports
-from helpers import get_setting
+from helpers import SETTINGS
 
 # global variables
-log = logging.getLogger()
+log = logging.getLogger(__name__)
 
 
 def get_dhcp_options_domain(ec2_client, vpc_id):
@@ -23,8 +23,7 @@ def get_dhcp_options_domain(ec2_client, vpc_id):
     # get the DHCP options ID associated with this VPC
     vpcs = ec2_client.describe_vpcs(VpcIds=[vpc_id]).get("Vpcs", [])
     if len(vpcs) != 1:
-        log.error(
-            "describe_vpcs returned {} VPCs instead of expected 1".format(len(vpcs)))
+        log.error("describe_vpcs returned %s VPCs instead of expected 1", len(vpcs))
         return None
     dhcp_options_id = vpcs[0].get("DhcpOptionsId", None)
     if dhcp_options_id is None:
@@ -35,8 +34,7 @@ def get_dhcp_options_domain(ec2_client, vpc_id):
     dhcp_options = ec2_client.describe_dhcp_options(
         DhcpOptionsIds=[dhcp_options_id]).get("DhcpOptions", [])
     if len(dhcp_options) != 1:
-        log.error("describe_dhcp_options returned {} options instead of expected 1".format(
-            len(dhcp_options)))
+        log.error("describe_dhcp_options returned %s options instead of expected 1", len(dhcp_options))
         return None
     dhcp_configs = dhcp_options[0].get("DhcpConfigurations", [])
 
@@ -69,13 +67,10 @@ def get_dns_domain(ec2_client, vpc_id, region, tags):
     Returns:
       str:  The DNS domain for the instance.
     """
-    dns_domain_tag_name_account_tag = get_setting(
-        "dns_domain_tag_name_account_tag")
-    log.info("dns_domain_tag_name_account_tag: {}".format(
-        dns_domain_tag_name_account_tag))
-    default_dns_domain_tag_name = get_setting("default_dns_domain_tag_name")
-    log.info("default_dns_domain_tag_name: {}".format(
-        default_dns_domain_tag_name))
+    dns_domain_tag_name_account_tag = SETTINGS.dns_domain_tag_name_account_tag
+    log.info("dns_domain_tag_name_account_tag: %s", dns_domain_tag_name_account_tag)
+    default_dns_domain_tag_name = SETTINGS.default_dns_domain_tag_name
+    log.info("default_dns_domain_tag_name: %s", default_dns_domain_tag_name)
 
     dns_domain_tag = tags.get(
         dns_domain_tag_name_account_tag, default_dns_domain_tag_name)
@@ -102,12 +97,10 @@ def get_hostname(tags):
     Returns:
       str:  The hostname for the instance or None if no tags were found.
     """
-    hostname_tag_name_account_tag = get_setting(
-        "hostname_tag_name_account_tag")
-    log.info("hostname_tag_name_account_tag: {}".format(
-        hostname_tag_name_account_tag))
-    default_hostname_tag_name = get_setting("default_hostname_tag_name")
-    log.info("default_hostname_tag_name: {}".format(default_hostname_tag_name))
+    hostname_tag_name_account_tag = SETTINGS.hostname_tag_name_account_tag
+    log.info("hostname_tag_name_account_tag: %s", hostname_tag_name_account_tag)
+    default_hostname_tag_name = SETTINGS.default_hostname_tag_name
+    log.info("default_hostname_tag_name: %s", default_hostname_tag_name)
 
     hostname_tag = tags.get(hostname_tag_name_account_tag,
                             default_hostname_tag_name)
@@ -1,13 +1,23 @@
 # Python imports
+import functools
 import logging
 import os
+import time
+import types
 
 # 3rd party imports
+from botocore.config import Config
 
 # local imports
 
 # global variables
-log = logging.getLogger()
+log = logging.getLogger(__name__)
+
+# shared client configuration: fail fast rather than hanging behind a NAT gateway or a missing VPC endpoint, and cap
+# retry amplification.  The function is expected to run outside a VPC - or with interface endpoints for EC2/STS/
+# Organizations and a gateway endpoint for DynamoDB - so API calls avoid public internet round-trips entirely.
+CLIENT_CONFIG = Config(connect_timeout=2, read_timeout=5, retries={"max_attempts": 3})
+_account_tags_cache = {}
 defaults = {
     "dynamo_table_name": {
         "env_var": "DYNAMO_TABLE_NAME",
@@ -55,6 +65,10 @@ defaults = {
     }
 }
 
+# settings are resolved from the environment once at cold start; the environment does not change at runtime
+SETTINGS = types.SimpleNamespace(
+    **{name: os.environ.get(config["env_var"], config["default"]) for name, config in defaults.items()})
+
 
 def get_event_value(event, key):
     """Gets a value from the event and raises an Exception if it is missing.
@@ -77,8 +91,34 @@ def get_event_value(event, key):
     return value
 
 
+def get_account_tags(org_client, account_id, ttl=300):
+    """Retrieves the tags attached to the given account, caching them across warm invocations.
+
+    Tags are re-fetched from the Organizations API only when the cached copy is missing or older than the given TTL.
+
+    Parameters:
+      org_client (object):  The Organizations client object.
+      account_id (str):     The ID of the account whose tags should be retrieved.
+      ttl (int):            Number of seconds for which cached tags remain valid.
+
+    Returns:
+      dict: Dictionary of tags attached to the account.
+    """
+    now = time.monotonic()
+    cached = _account_tags_cache.get(account_id, None)
+    if cached is not None and now - cached[0] < ttl:
+        return cached[1]
+    tags = tags_to_dict(org_client.list_tags_for_resource(ResourceId=account_id).get("Tags", []))
+    _account_tags_cache[account_id] = (now, tags)
+    return tags
+
+
+@functools.lru_cache(maxsize=None)
 def get_setting(setting):
-    """Retrieves the value of a setting from the environment.
+    """Retrieves the value of a setting resolved from the environment at cold start.
+
+    Settings are evaluated once at module import into SETTINGS; prefer accessing attributes on SETTINGS directly.
+    This wrapper remains for callers that look settings up by name.
 
     Parameters:
       setting (str):  The name of the setting to retrieve.
@@ -86,10 +126,36 @@ def get_setting(setting):
     Returns:
       object: The value of the setting.
     """
-    value = os.environ.get(defaults[setting]["env_var"], None)
-    if value is None:
-        return defaults[setting]["default"]
-    return value
+    return getattr(SETTINGS, setting)
+
+
+def batch_write_items(dynamo_client, table_name, requests):
+    """Writes the given put/delete requests to a DynamoDB table in batches.
+
+    Requests are submitted in chunks of 25 (the BatchWriteItem limit) and any unprocessed items reported by
+    DynamoDB are resubmitted with a growing delay until the batch drains or the attempt limit is reached.
+
+    Parameters:
+      dynamo_client (object): The DynamoDB client object.
+      table_name (str):       The name of the table to write to.
+      requests (list):        A list of PutRequest/DeleteRequest entries to submit.
+
+    Raises:
+      Exception:  If items remain unprocessed after the attempt limit.
+    """
+    for i in range(0, len(requests), 25):
+        batch = {table_name: requests[i:i + 25]}
+        for attempt in range(10):
+            if attempt > 0:
+                time.sleep(min(0.1 * attempt, 1.0))
+            batch = dynamo_client.batch_write_item(RequestItems=batch).get("UnprocessedItems", {})
+            if not batch:
+                break
+        if batch:
+            msg = "batch write left {} unprocessed item(s) after {} attempts".format(
+                len(batch.get(table_name, [])), attempt + 1)
+            log.fatal(msg)
+            raise Exception(msg)
 
 
 def tags_to_dict(tags):
@@ -3,30 +3,136 @@ import json
 import logging
 import logging.handlers
 import os
+import socket
 import sys
+import time
+import types
+from datetime import datetime, timezone
 sys.path.insert(0, "{}/package".format(os.environ.get("LAMBDA_TASK_ROOT", sys.path[0])))
 sys.path.insert(0, "{}".format(os.environ.get("LAMBDA_TASK_ROOT", sys.path[0])))
 
+# resolve the region up front so botocore never falls back to an EC2 metadata lookup when building clients, and
+# disable the metadata service outright - Lambda credentials come from the execution role environment, not IMDS
+os.environ.setdefault("AWS_DEFAULT_REGION", os.environ.get("AWS_REGION", "us-east-1"))
+os.environ.setdefault("AWS_EC2_METADATA_DISABLED", "true")
+
 # 3rd party imports
 import boto3
 import urllib.request
 
 # local imports
 from route53_helpers import register_host, unregister_host
-from helpers import get_event_value, get_setting, tags_to_dict
+from helpers import CLIENT_CONFIG, SETTINGS, batch_write_items, get_account_tags, get_event_value
+
+# configure logging once at cold start; the Lambda runtime installs its own root handler, in which case
+# basicConfig is a no-op and only the root level needs to be set
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO"))
+logging.getLogger().setLevel(os.environ.get("LOG_LEVEL", "INFO"))
 
 # global variables
-log = logging.getLogger()
-org_client = boto3.client("organizations")
-sts_client = boto3.client("sts")
-dynamo_client = boto3.client("dynamodb")
+log = logging.getLogger(__name__)
+_CLIENTS = None
+_assumed_role_cache = {}
+_ec2_client_cache = {}
+_dns_cache = {}
+_orig_getaddrinfo = socket.getaddrinfo
+
+
+def _cached_getaddrinfo(host, port, *args, **kwargs):
+  """TTL-caching wrapper around socket.getaddrinfo.
+
+  Python performs no DNS caching of its own, so every new connection re-resolves the AWS service endpoints this
+  function talks to. The endpoints are stable, so successful lookups are pinned for 60 seconds; failures are
+  never cached.
+  """
+  key = (host, port, args, tuple(sorted(kwargs.items())))
+  now = time.monotonic()
+  hit = _dns_cache.get(key, None)
+  if hit is not None and hit[0] > now:
+    return hit[1]
+  result = _orig_getaddrinfo(host, port, *args, **kwargs)
+  _dns_cache[key] = (now + 60, result)
+  return result
+
+
+socket.getaddrinfo = _cached_getaddrinfo
+
+
+def _clients():
+  """Returns the shared AWS clients, constructing them on first use.
+
+  Construction is deferred until the handler has validated the event, so malformed events never pay for client
+  bootstrap; once built, the clients are reused for the life of the warm container.
+
+  Returns:
+    object: Namespace holding the org, sts and dynamo client objects.
+  """
+  global _CLIENTS
+  if _CLIENTS is None:
+    region = os.environ["AWS_DEFAULT_REGION"]
+    _CLIENTS = types.SimpleNamespace(
+        org=boto3.client("organizations", region_name=region, config=CLIENT_CONFIG),
+        sts=boto3.client("sts", region_name=region, config=CLIENT_CONFIG),
+        dynamo=boto3.client("dynamodb", region_name=region, config=CLIENT_CONFIG))
+  return _CLIENTS
+
+
+def assume_role(role_arn, account_id):
+  """Assumes the given IAM role, reusing cached credentials across warm invocations.
+
+  Credentials are cached per account and reused until they are within 5 minutes of expiring, at which point a new
+  assume_role call is made.
+
+  Parameters:
+    role_arn (str):   The ARN of the IAM role to assume.
+    account_id (str): The ID of the account to which the role belongs.
+
+  Returns:
+    dict: The assume_role response containing the role credentials.
+  """
+  role = _assumed_role_cache.get(account_id, None)
+  if role is not None:
+    remaining = (role["Credentials"]["Expiration"] - datetime.now(timezone.utc)).total_seconds()
+    if remaining > 300:
+      return role
+  role = _clients().sts.assume_role(RoleArn=role_arn, RoleSessionName="awsaccount_session")
+  _assumed_role_cache[account_id] = role
+  return role
+
+
+def get_ec2_client(role, account_id, region):
+  """Returns an EC2 client using the given role credentials, reusing cached clients across warm invocations.
+
+  A cached client is reused as long as it was built from the same credentials as the given role; when the role
+  credentials rotate, a new client is constructed.
+
+  Parameters:
+    role (dict):      The assume_role response containing the role credentials.
+    account_id (str): The ID of the account to which the role belongs.
+    region (str):     The region in which the client operates.
+
+  Returns:
+    object: The EC2 client object.
+  """
+  expiration = role["Credentials"]["Expiration"]
+  cached = _ec2_client_cache.get((account_id, region), None)
+  if cached is not None and cached[0] == expiration:
+    return cached[1]
+  ec2_client = boto3.client("ec2",
+                            region_name=region,
+                            config=CLIENT_CONFIG,
+                            aws_access_key_id=role["Credentials"]["AccessKeyId"],
+                            aws_secret_access_key=role["Credentials"]["SecretAccessKey"],
+                            aws_session_token=role["Credentials"]["SessionToken"])
+  _ec2_client_cache[(account_id, region)] = (expiration, ec2_client)
+  return ec2_client
+
 
 def lambda_handler(event, context):
   """aws lambda main func"""
-  log.setLevel(logging.INFO)
   log.info("=== Starting update-route53-host-records ===")
-  log.info("sys.path: {}".format(sys.path))
-  log.info("boto3 version: {}".format(boto3.__version__))
+  log.info("sys.path: %s", sys.path)
+  log.info("boto3 version: %s", boto3.__version__)
 
   # get settings from event
   account_id = get_event_value(event, "account")
@@ -37,65 +143,75 @@ def lambda_handler(event, context):
 
   # state must be "running" or "terminated" - otherwise there's nothing to do
   if state not in ["running", "shutting-down", "stopping"]:
-    log.info("Nothing to do... state is '{}'".format(state))
+    log.info("Nothing to do... state is '%s'", state)
     log.info("=== Finished update-route53-host-records ===\n")
     return 0
-  log.info("state: {}".format(state))
+  log.info("state: %s", state)
+
+  # the event checks out - only now is it worth constructing the AWS clients
+  clients = _clients()
+
+  # a stopping host only needs its previously registered records cleaned up - handle it before the
+  # Organizations/STS round-trips below, which are only needed to reach the EC2 API
+  if state in ["shutting-down", "stopping"]:
+    try:
+      unregister_host(clients.dynamo, SETTINGS.dynamo_table_name, instance_id)
+    finally:
+      log.info("=== Finished update-route53-host-records ===\n")
+    return 0
 
   # configure settings
-  account_state_tag = get_setting("account_state_tag")
-  log.info("account_state_tag: {}".format(account_state_tag))
-  account_enabled_values = [v.strip() for v in get_setting("account_enabled_values").split(":")]
-  log.info("account_enabled_values: {}".format(account_enabled_values))
-  iam_role_tag = get_setting("iam_role_tag")
-  log.info("iam_role_tag: {}".format(iam_role_tag))
-  default_iam_role = get_setting("default_iam_role")
-  log.info("default_iam_role: {}".format(default_iam_role))
+  account_state_tag = SETTINGS.account_state_tag
+  log.info("account_state_tag: %s", account_state_tag)
+  account_enabled_values = [v.strip() for v in SETTINGS.account_enabled_values.split(":")]
+  log.info("account_enabled_values: %s", account_enabled_values)
+  iam_role_tag = SETTINGS.iam_role_tag
+  log.info("iam_role_tag: %s", iam_role_tag)
+  default_iam_role = SETTINGS.default_iam_role
+  log.info("default_iam_role: %s", default_iam_role)
 
   # determine if the function is enabled on the account
-  account = org_client.describe_account(AccountId=account_id)
+  account = clients.org.describe_account(AccountId=account_id)
   name = account.get("Name", account_id)
-  tags = tags_to_dict(org_client.list_tags_for_resource(ResourceId=account_id).get("Tags", []))
+  tags = get_account_tags(clients.org, account_id)
 
   # skip the account if it is not enabled
   if account_state_tag not in tags or tags[account_state_tag] not in account_enabled_values:
-    log.info("skipping disabled account: {} ({})".format(name, account_id))
+    log.info("skipping disabled account: %s (%s)", name, account_id)
     log.info("=== Finished update-route53-host-records ===\n")
     return 0
-  log.info("updating records for account: {} ({})".format(name, account_id))
+  log.info("updating records for account: %s (%s)", name, account_id)
 
   # configure the IAM role
   iam_role = tags.get(iam_role_tag, None)
   if iam_role is None:
     iam_role = default_iam_role
-  role_arn = "arn:aws:iam::{}:role/{}".format(id, iam_role)
-  log.info("   arn: {}".format(role_arn))
+  role_arn = "arn:aws:iam::{}:role/{}".format(account_id, iam_role)
+  log.info("   arn: %s", role_arn)
 
   # assume the role
-  role = sts_client.assume_role(RoleArn=role_arn, RoleSessionName="awsaccount_session")
-  log.info("assumed role: {}".format(role_arn))
+  role = assume_role(role_arn, account_id)
+  log.info("assumed role: %s", role_arn)
 
   # create the EC2 client
-  ec2_client = boto3.client("ec2",
-                            region_name=region,
-                            aws_access_key_id=role["Credentials"]["AccessKeyId"],
-                            aws_secret_access_key=role["Credentials"]["SecretAccessKey"],
-                            aws_session_token=role["Credentials"]["SessionToken"])
+  ec2_client = get_ec2_client(role, account_id, region)
 
   try:
-    if state == "running":
-      records = register_host(ec2_client, region, instance_id)
-      table_name = get_setting("dynamo_table_name")
-      dynamo_client.put_item(TableName=table_name, Item={
-        "InstanceId": {
-          "S": instance_id,
-        },
-        "Records": {
-          "L": records,
+    records = register_host(ec2_client, region, instance_id)
+    if records:
+      # store one entry per record so unregistration can look them up and batch them by zone
+      batch_write_items(clients.dynamo, SETTINGS.dynamo_table_name, [{
+        "PutRequest": {
+          "Item": {
+            "InstanceId": {"S": instance_id},
+            "RecordKey": {"S": "{}#{}#{}".format(r["zone_id"], r["name"], r["type"])},
+            "ZoneId": {"S": r["zone_id"]},
+            "Type": {"S": r["type"]},
+            "Name": {"S": r["name"]},
+            "Data": {"S": r["data"]}
+          }
         }
-      })
-    else:
-      unregister_host(instance_id)
+      } for r in records])
   finally:
     log.info("=== Finished update-route53-host-records ===\n")
   return 0
@@ -107,8 +223,6 @@ if __name__ == "__main__":
     print("USAGE: {} <JSON event file>".format(sys.argv[0]))
     sys.exit(1)
   try:
-    ch = logging.StreamHandler()
-    log.addHandler(ch)
     with open(sys.argv[1], "r") as event_file:
       event = json.load(event_file)
     lambda_handler(event, None)
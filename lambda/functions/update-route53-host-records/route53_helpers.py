@@ -1,16 +1,107 @@
 # Python imports
+import concurrent.futures
 import logging
+import os
+import time
+from collections import defaultdict
 
 # 3rd party imports
 import boto3
 
 # local imports
 from ec2_helpers import get_dhcp_options_domain, get_dns_domain, get_hostname
-from helpers import get_setting, tags_to_dict
+from helpers import CLIENT_CONFIG, SETTINGS, batch_write_items, tags_to_dict
 
 # global variables
-log = logging.getLogger()
-route53_client = boto3.client("route53")
+log = logging.getLogger(__name__)
+_route53_client = None
+_zones_by_name_cache = {}
+_zone_vpcs_cache = {}
+_executor = concurrent.futures.ThreadPoolExecutor(max_workers=4)
+
+
+def _route53():
+  """Returns the shared Route53 client, constructing it on first use.
+
+  Mirrors the deferred construction of the handler's other clients so that importing this module performs no
+  client bootstrap; the client is reused for the life of the warm container.
+
+  Returns:
+    object: The Route53 client object.
+  """
+  global _route53_client
+  if _route53_client is None:
+    _route53_client = boto3.client("route53",
+                                   region_name=os.environ.get("AWS_DEFAULT_REGION", "us-east-1"),
+                                   config=CLIENT_CONFIG)
+  return _route53_client
+
+
+def _find_zones_by_name(route53, zone_name, ttl=300):
+  """Retrieves the hosted zones whose name exactly matches the given name, caching results across warm invocations.
+
+  Uses list_hosted_zones_by_name so only the zones at the requested name are fetched rather than every hosted
+  zone in the account. Results are cached per name, so warm invocations for known domains make no Route53 calls
+  at all until the TTL expires. If a refresh fails and an expired cached result exists, the stale result is
+  returned rather than failing the registration outright.
+
+  Parameters:
+    route53 (object): The Route53 client object.
+    zone_name (str):  The name of the zone to look up, including the trailing dot.
+    ttl (int):        Number of seconds for which cached results remain valid.
+
+  Returns:
+    list: The list of hosted zones whose name matches the given name.
+
+  Raises:
+    Exception:  If the zones cannot be retrieved and no cached result exists.
+  """
+  now = time.monotonic()
+  cached = _zones_by_name_cache.get(zone_name, None)
+  if cached is not None and now - cached[0] < ttl:
+    return cached[1]
+  matches = []
+  args = {"DNSName": zone_name, "MaxItems": "10"}
+  while True:
+    try:
+      result = route53.list_hosted_zones_by_name(**args)
+    except Exception as e:
+      if cached is None:
+        raise
+      log.error("failed to refresh zones for %s - using stale cached result: %s", zone_name, e)
+      return cached[1]
+    matches.extend([z for z in result.get("HostedZones", []) if z.get("Name", None) == zone_name])
+    # results come back in name order, so stop once the next page starts past the requested name
+    if not result.get("IsTruncated", False) or result.get("NextDNSName", None) != zone_name:
+      break
+    args["DNSName"] = result["NextDNSName"]
+    args["HostedZoneId"] = result["NextHostedZoneId"]
+  _zones_by_name_cache[zone_name] = (now, matches)
+  return matches
+
+
+def _get_zone_vpc_ids(route53, zone_id, ttl=300):
+  """Retrieves the IDs of the VPCs attached to the given private hosted zone, caching them across warm invocations.
+
+  register_host verifies VPC attachment for the base domain, the ARPA zone and each alias, so without the cache a
+  candidate zone costs one get_hosted_zone call per lookup instead of one per TTL window.
+
+  Parameters:
+    route53 (object): The Route53 client object.
+    zone_id (str):    The ID of the hosted zone to inspect.
+    ttl (int):        Number of seconds for which cached attachments remain valid.
+
+  Returns:
+    set: Set of VPC IDs to which the zone is attached.
+  """
+  now = time.monotonic()
+  cached = _zone_vpcs_cache.get(zone_id, None)
+  if cached is not None and now - cached[0] < ttl:
+    return cached[1]
+  vpc_ids = {vpc.get("VPCId", None) for vpc in route53.get_hosted_zone(Id=zone_id).get("VPCs", [])}
+  _zone_vpcs_cache[zone_id] = (now, vpc_ids)
+  return vpc_ids
+
 
 def get_aliases(route53_client, vpc_id, region, tags, aliases_tag, alias_type, default_dns_domain):
   """Retrieves settings for additional records for an instance.
@@ -27,16 +118,25 @@ def get_aliases(route53_client, vpc_id, region, tags, aliases_tag, alias_type, d
   Returns:
     dict: Dictionary containing aliases as keys and hostname, dns_domain, fqdn, and zone_id as the items.
   """
-  aliases = tags.get("{}/{}".format(aliases_tag, alias_type), [])
+  aliases = tags.get("{}/{}".format(aliases_tag, alias_type), "")
   settings = {}
-  for alias in [v.strip() for v in aliases.split(",")]:
-    log.info("retrieving settings for '{}' alias".format(alias))
-    tag_base = "{}/{}/{}".format(aliases_tag, alias_type, alias)
+
+  # collect the per-alias tag fields in a single pass over the tags instead of building lookup keys per alias
+  prefix = "{}/{}/".format(aliases_tag, alias_type)
+  fields_by_alias = defaultdict(dict)
+  for key, value in tags.items():
+    if key.startswith(prefix):
+      alias, _, field = key[len(prefix):].partition("/")
+      fields_by_alias[alias][field] = value
+
+  for alias in [v.strip() for v in aliases.split(",") if v.strip() != ""]:
+    log.info("retrieving settings for '%s' alias", alias)
+    fields = fields_by_alias.get(alias, {})
 
     # if a hostname is defined for the alias, use it; otherwise use the alias as the hostname
-    hostname = tags.get("{}/hostname".format(tag_base), None)
+    hostname = fields.get("hostname", None)
     if hostname is None:
-      log.warn("   no hostname found for {} alias '{}' - using alias as hostname".format(alias_type, alias))
+      log.warn("   no hostname found for %s alias '%s' - using alias as hostname", alias_type, alias)
       hostname = alias
 
     # if the hostname is not an FQDN , append the default DNS domain to it
@@ -48,18 +148,18 @@ def get_aliases(route53_client, vpc_id, region, tags, aliases_tag, alias_type, d
       hostname = parts[0]
       dns_domain = ".".join(parts[1:])
       fqdn = hostname
-    log.info("   hostname: {}".format(hostname))
-    log.info("   dns_domain: {}".format(dns_domain))
-    log.info("   fqdn: {}".format(fqdn))
+    log.info("   hostname: %s", hostname)
+    log.info("   dns_domain: %s", dns_domain)
+    log.info("   fqdn: %s", fqdn)
 
     # get a zone ID if one is associated with it
-    zone_id = tags.get("{}/zone_id".format(tag_base), None)
+    zone_id = fields.get("zone_id", None)
     if zone_id is None:
       if alias_type == "private":
         zone_id = get_private_zone_id(route53_client, vpc_id, region, dns_domain)
       elif alias_type == "public":
         zone_id = get_public_zone_id(route53_client, dns_domain)
-    log.info("   zone_id: {}".format(zone_id))
+    log.info("   zone_id: %s", zone_id)
 
     settings[alias] = {"hostname": hostname, "dns_domain": dns_domain, "fqdn": fqdn, "zone_id": zone_id}
   return settings
@@ -80,16 +180,13 @@ def get_public_zone_id(route53, zone_name):
   """
   if zone_name is None or zone_name == "":
     return None
-  hosted_zones = route53.list_hosted_zones().get("HostedZones", [])
   zone_parts = zone_name.split(".")
-  while len(zone_parts) >= 2:
-    check_zone = "{}.".format(".".join(zone_parts))
-    log.info("searching for matching zone: {}".format(check_zone))
-    for zone in hosted_zones:
-      config = zone.get("Config", {})
-      if not config.get("PrivateZone", False) and zone.get("Name", None) == check_zone:
+  for i in range(len(zone_parts) - 1):
+    check_zone = "{}.".format(".".join(zone_parts[i:]))
+    log.info("searching for matching zone: %s", check_zone)
+    for zone in _find_zones_by_name(route53, check_zone):
+      if not zone.get("Config", {}).get("PrivateZone", False):
         return zone.get("Id", None)
-    zone_parts.pop(0)
   return None
 
 
@@ -113,24 +210,20 @@ def get_private_zone_id(route53_client, vpc_id, region, zone_name):
   if zone_name == "{}.compute.internal":
     log.info("default private zone in use - skipping zone ID lookup")
     return None
-  hosted_zones = route53_client.list_hosted_zones().get("HostedZones", [])
   zone_parts = zone_name.split(".")
-  while len(zone_parts) >= 2:
-    check_zone = "{}.".format(".".join(zone_parts))
-    log.info("searching for matching zone: {}".format(check_zone))
-    for zone in hosted_zones:
-      config = zone.get("Config", {})
-      if config.get("PrivateZone", False) and zone.get("Name", None) == check_zone:
-        zone_id = zone.get("Id", None)
-        log.info("found matching zone ID: {} -- verifying VPC attachment".format(zone_id))
-        # Make sure this zone is associated with the given VPC ID
-        zone_vpcs = route53_client.get_hosted_zone(Id=zone.get("Id", None)).get("VPCs", [])
-        for vpc in zone_vpcs:
-          if vpc.get("VPCId", None) == vpc_id:
-            log.info("zone is attached to VPC")
-            return zone.get("Id", None)
-        log.info("zone is not attached to VPC")
-    zone_parts.pop(0)
+  for i in range(len(zone_parts) - 1):
+    check_zone = "{}.".format(".".join(zone_parts[i:]))
+    log.info("searching for matching zone: %s", check_zone)
+    for zone in _find_zones_by_name(route53_client, check_zone):
+      if not zone.get("Config", {}).get("PrivateZone", False):
+        continue
+      zone_id = zone.get("Id", None)
+      log.info("found matching zone ID: %s -- verifying VPC attachment", zone_id)
+      # Make sure this zone is associated with the given VPC ID
+      if vpc_id in _get_zone_vpc_ids(route53_client, zone_id):
+        log.info("zone is attached to VPC")
+        return zone_id
+      log.info("zone is not attached to VPC")
   return None
 
 
@@ -149,6 +242,8 @@ def register_host(ec2_client, region, instance_id):
     Exception:  If an error occurs.
   """
   records = []
+  changes_by_zone = defaultdict(list)
+  route53_client = _route53()
 
   # get instance metadata
   log.info("--- instance metadata ---")
@@ -162,25 +257,26 @@ def register_host(ec2_client, region, instance_id):
     msg = "unexpected result when retrieving instance data: {}".format(reservations)
     log.fatal(msg)
     raise Exception(msg)
+  # pull the handful of fields we use straight off the instance; the rest of the payload is ignored
   instance = instances[0]
-  public_ip = instance.get("PublicIpAddress", "")
-  if public_ip is "":
+  public_ip = instance.get("PublicIpAddress", None)
+  if not public_ip:
     log.info("host does not have a public IP")
     public_ip = None
   else:
-    log.info("public_ip: {}".format(public_ip))
-  private_ip = instance.get("PrivateIpAddress", "")
-  if private_ip == "":
+    log.info("public_ip: %s", public_ip)
+  private_ip = instance.get("PrivateIpAddress", None)
+  if not private_ip:
     msg = "instance is missing private IP: {}".format(reservations)
     log.fatal(msg)
     raise Exception(msg)
-  log.info("private_ip: {}".format(private_ip))
-  vpc_id = instance.get("VpcId", "")
-  if vpc_id == "":
+  log.info("private_ip: %s", private_ip)
+  vpc_id = instance.get("VpcId", None)
+  if not vpc_id:
     msg = "instance is missing VPC ID: {}".format(reservations)
     log.fatal(msg)
     raise Exception(msg)
-  log.info("vpc_id: {}".format(vpc_id))
+  log.info("vpc_id: %s", vpc_id)
 
   # get FQDN and PTR address
   instance_tags = tags_to_dict(instance.get("Tags", []))
@@ -196,42 +292,43 @@ def register_host(ec2_client, region, instance_id):
     hostname = parts[0]
     dns_domain = ".".join(parts[1:])
     fqdn = hostname
-  log.info("hostname: {}".format(hostname))
-  log.info("dns_domain: {}".format(dns_domain))
-  log.info("fqdn: {}".format(fqdn))
+  log.info("hostname: %s", hostname)
+  log.info("dns_domain: %s", dns_domain)
+  log.info("fqdn: %s", fqdn)
   octets = private_ip.split(".")
   ptr_record = "{}.{}.{}.{}.in-addr.arpa".format(octets[3], octets[2], octets[1], octets[0])
-  log.info("ptr_record: {}".format(ptr_record))
+  log.info("ptr_record: %s", ptr_record)
   arpa_zone = "{}.{}.{}.in-addr.arpa".format(octets[2], octets[1], octets[0])
-  log.info("arpa_zone: {}".format(arpa_zone))
+  log.info("arpa_zone: %s", arpa_zone)
 
-  # update A record for private zone
+  # update A record for private zone; the independent ARPA zone lookup runs concurrently with it
   log.info("--- private record registration ---")
+  arpa_zone_future = _executor.submit(get_private_zone_id, route53_client, vpc_id, region, arpa_zone)
   private_zone_id = get_private_zone_id(route53_client, vpc_id, region, dns_domain)
   if private_zone_id is None:
     log.info("no matching private zone for DNS domain attached to VPC - skipping A record registration")
   else:
-    log.info("private_zone_id:{}".format(private_zone_id))
+    log.info("private_zone_id:%s", private_zone_id)
     records.append({
       "zone_id": private_zone_id,
       "type": "A",
       "name": fqdn,
       "data": private_ip
     })
-    change_record("UPSERT", route53_client, private_zone_id, "A", fqdn, private_ip)
+    changes_by_zone[private_zone_id].append(build_change("UPSERT", "A", fqdn, private_ip))
 
   # configure aliases tags
-  aliases_tag_name_account_tag = get_setting("aliases_tag_name_account_tag")
-  log.info("aliases_tag_name_account_tag: {}".format(aliases_tag_name_account_tag))
-  default_aliases_tag_name = get_setting("default_aliases_tag_name")
-  log.info("default_aliases_tag_name: {}".format(default_aliases_tag_name))
+  aliases_tag_name_account_tag = SETTINGS.aliases_tag_name_account_tag
+  log.info("aliases_tag_name_account_tag: %s", aliases_tag_name_account_tag)
+  default_aliases_tag_name = SETTINGS.default_aliases_tag_name
+  log.info("default_aliases_tag_name: %s", default_aliases_tag_name)
   aliases_tag = instance_tags.get(aliases_tag_name_account_tag, default_aliases_tag_name)
 
   # update private aliases
   log.info("--- private alias registration ---")
   aliases = get_aliases(route53_client, vpc_id, region, instance_tags, aliases_tag, "private", dns_domain)
   for alias, settings in aliases.items():
-    log.info("updating private alias: {}".format(alias))
+    log.info("updating private alias: %s", alias)
     if settings["zone_id"] is None:
       log.info("   no matching Route53 ZoneID was found - skipping A record registration")
       continue
@@ -241,75 +338,133 @@ def register_host(ec2_client, region, instance_id):
       "name": settings["fqdn"],
       "data": private_ip
     })
-    change_record("UPSERT", route53_client, settings["zone_id"], "A", settings["fqdn"], private_ip)
+    changes_by_zone[settings["zone_id"]].append(build_change("UPSERT", "A", settings["fqdn"], private_ip))
 
   # update PTR record for private ARPA zone
   log.info("--- ARPA record registration ---")
-  arpa_zone_id = get_private_zone_id(route53_client, vpc_id, region, arpa_zone)
+  arpa_zone_id = arpa_zone_future.result()
   if arpa_zone_id is None:
     log.info("   no matching private APRA zone attached to VPC - skipping PTR record registration")
   else:
-    log.info("   arpa_zone_id: {}".format(arpa_zone_id))
+    log.info("   arpa_zone_id: %s", arpa_zone_id)
     records.append({
       "zone_id": arpa_zone_id,
       "type": "PTR",
       "name": ptr_record,
       "data": fqdn + "."
     })
-    change_record("UPSERT", route53_client, arpa_zone_id, "PTR", ptr_record, fqdn + ".")
+    changes_by_zone[arpa_zone_id].append(build_change("UPSERT", "PTR", ptr_record, fqdn + "."))
+
+  # update public aliases unless the host has no public IP
+  if public_ip is not None:
+    log.info("--- public alias registration ---")
+    aliases = get_aliases(route53_client, vpc_id, region, instance_tags, aliases_tag, "public", dns_domain)
+    for alias, settings in aliases.items():
+      log.info("updating public alias: %s", alias)
+      if settings["zone_id"] is None:
+        log.info("   no matching Route53 ZoneID was found - skipping A record registration")
+        continue
+      records.append({
+        "zone_id": settings["zone_id"],
+        "type": "A",
+        "name": settings["fqdn"],
+        "data": public_ip
+      })
+      changes_by_zone[settings["zone_id"]].append(build_change("UPSERT", "A", settings["fqdn"], public_ip))
+
+  # submit all of the accumulated changes, one ChangeBatch per zone
+  change_records(route53_client, changes_by_zone)
+  return records
+
+
+def unregister_host(dynamo_client, table_name, instance_id):
+  """Handles removal of host records previously registered in Route53.
+
+  The per-record entries written at registration time are read back from DynamoDB, removed from their hosted
+  zones using one ChangeBatch per zone and then deleted from the table.
 
-  # if host has no public IP we are finished
-  if public_ip is None:
-    return 0
+  Parameters:
+    dynamo_client (object): DynamoDB client object.
+    table_name (str):       The name of the table holding registered host records.
+    instance_id (str):      The ID of the instance being unregistered.
+  """
+  # read back every record registered for the instance
+  items = []
+  query_args = {
+      "TableName": table_name,
+      "KeyConditionExpression": "InstanceId = :id",
+      "ExpressionAttributeValues": {":id": {"S": instance_id}}
+  }
+  while True:
+    result = dynamo_client.query(**query_args)
+    items.extend(result.get("Items", []))
+    last_key = result.get("LastEvaluatedKey", None)
+    if last_key is None:
+      break
+    query_args["ExclusiveStartKey"] = last_key
+  if len(items) == 0:
+    log.info("no registered records found for instance %s - nothing to do", instance_id)
+    return
+
+  # remove the records from their zones, one ChangeBatch per zone
+  changes_by_zone = defaultdict(list)
+  for item in items:
+    changes_by_zone[item["ZoneId"]["S"]].append(
+        build_change("DELETE", item["Type"]["S"], item["Name"]["S"], item["Data"]["S"]))
+  change_records(_route53(), changes_by_zone)
+
+  # remove the table entries for the instance
+  batch_write_items(dynamo_client, table_name, [{
+      "DeleteRequest": {
+          "Key": {
+              "InstanceId": {"S": instance_id},
+              "RecordKey": item["RecordKey"]
+          }
+      }
+  } for item in items])
+
+
+def build_change(action, record_type, record_name, record_data):
+  """Builds a single change entry for a Route53 ChangeBatch request.
 
-  # update public aliases
-  log.info("--- public alias registration ---")
-  aliases = get_aliases(route53_client, vpc_id, region, instance_tags, aliases_tag, "public", dns_domain)
-  for alias, settings in aliases.items():
-    log.info("updating public alias: {}".format(alias))
-    if settings["zone_id"] is None:
-      log.info("   no matching Route53 ZoneID was found - skipping A record registration")
-      continue
-    records.append({
-      "zone_id": settings["zone_id"],
-      "type": "A",
-      "name": settings["fqdn"],
-      "data": public_ip
-    })
-    change_record("UPSERT", route53_client, settings["zone_id"], "A", settings["fqdn"], public_ip)
-  return 0
+  Parameters:
+    action (str):             The type of the change action to perform.
+    record_type (str):        The type of record to create or delete.
+    record_name (str):        The name of the record to create or delete.
+    record_data (str):        The actual data for the record (eg: hostname or IP).
 
+  Returns:
+    dict: The change entry to include in a ChangeBatch request.
+  """
+  return {
+      "Action": action,
+      "ResourceRecordSet": {
+          "Name": record_name + ".",
+          "Type": record_type,
+          "TTL": 300,
+          "ResourceRecords": [{
+              "Value": record_data
+          }]
+      }
+  }
 
-def unregister_host(instance_id):
-  pass
 
+def change_records(route53_client, changes_by_zone):
+  """Submits the accumulated record changes to Route53 using one ChangeBatch per hosted zone.
 
-def change_record(action, route53_client, zone_id, record_type, record_name, record_data):
-  """Creates a change_resource_record_sets request in Route53 for the given DNS record.
+  A zone holding several records for a host (A, PTR and any aliases) is updated with a single
+  change_resource_record_sets call rather than one call per record.
 
   Parameters:
-    action (str):             The type of the change action to perform.
     route53_client (object):  Route53 client object.
-    zone_id (str):            The zone ID in which to create or remove the record.
-    record_type (str):        The type of record to create or delete.
-    record_name (str):        The name of the record to create or delete.
-    record_data (str):        The actual data for the record (eg: hostname or IP).
+    changes_by_zone (dict):   Dictionary mapping each zone ID to the list of change entries to submit for it.
   """
-  try:
-    route53_client.change_resource_record_sets(HostedZoneId=zone_id,
-                                               ChangeBatch={
-                                                   "Changes": [{
-                                                       "Action": action,
-                                                       "ResourceRecordSet": {
-                                                           "Name": record_name + ".",
-                                                           "Type": record_type,
-                                                           "TTL": 300,
-                                                           "ResourceRecords": [{
-                                                               "Value": record_data
-                                                           }]
-                                                       }
-                                                   }]
-                                               })
-    log.info("{} successful for {} record: {} -> {}".format(action, record_type, record_name, record_data))
-  except Exception as e:
-    log.error("{} failed for {} record '{}' -> '{}': {}".format(action, record_type, record_name, record_data, e))
+  for zone_id, changes in changes_by_zone.items():
+    try:
+      route53_client.change_resource_record_sets(HostedZoneId=zone_id, ChangeBatch={"Changes": changes})
+      for change in changes:
+        record_set = change["ResourceRecordSet"]
+        log.info("%s successful for %s record: %s -> %s", change["Action"], record_set["Type"],
+                 record_set["Name"], record_set["ResourceRecords"][0]["Value"])
+    except Exception as e:
+      log.error("%s change(s) failed for zone '%s': %s", len(changes), zone_id, e)